@@ -5,42 +5,94 @@ This script creates a FastAPI server that uses Google Gemini's vision API
 to analyze skin lesion images and provide dermatological assessments.
 
 LOCATION: scripts/fastapi_backend.py
-DEPENDENCIES: fastapi, uvicorn, google-generativeai, python-multipart, pillow
+DEPENDENCIES: fastapi, uvicorn, google-generativeai, python-multipart, pillow, orjson, simplejpeg, uvloop, httptools, brotli-asgi
 
 To run locally:
-  pip install fastapi uvicorn google-generativeai python-multipart pillow
+  pip install fastapi uvicorn google-generativeai python-multipart pillow orjson simplejpeg uvloop httptools brotli-asgi
   uvicorn scripts.fastapi_backend:app --reload --port 8000
+
+To serve (a single worker unless DERMA_WORKERS is set, uvloop + httptools when installed):
+  python scripts/fastapi_backend.py
+
+For faster resize/convert/composite in deployments, swap in the drop-in Pillow-SIMD build:
+  pip uninstall -y pillow && CC="cc -mavx2" pip install -U --force-reinstall pillow-simd
+
+Optional ONNX Runtime inference for /infer (export once from the .pth model):
+  pip install onnx onnxruntime
+  python -c "from scripts.fastapi_backend import export_onnx_model; export_onnx_model()"
+  # optional int8 weights for CPU; only served once they match FP32 top-1 on the sample images
+  python -c "from scripts.fastapi_backend import quantize_onnx_model; quantize_onnx_model(['a.jpg', 'b.jpg'])"
 """
 
 from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import BinaryIO, Optional, Sequence, Union
+import asyncio
 import base64
+import hashlib
 import json
 import os
-import re
-from functools import lru_cache
+import threading
+from xml.sax.saxutils import escape
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from functools import lru_cache, partial
+from io import BytesIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Optional PyTorch inference dependencies
 try:
     import torch
     import torch.nn.functional as F
     from PIL import Image
-    from io import BytesIO
     import timm
-    from torchvision import transforms
-    import numpy as np
     from fastapi.responses import StreamingResponse
     from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
+    from reportlab.lib.styles import getSampleStyleSheet
     from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, Image as RLImage
     import torch.nn.functional as F
 except Exception:
     torch = None
     timm = None
     Image = None
-    transforms = None
+
+# Fast JSON parsing of LLM responses (falls back to stdlib json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# ONNX Runtime for classifier inference (falls back to PyTorch)
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+# OpenCV for image decode/resize in preprocessing (falls back to Pillow)
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# libjpeg-turbo JPEG encoder (falls back to Pillow)
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+# Brotli response compression (falls back to gzip)
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
 
 # Google Gemini SDK
 try:
@@ -49,21 +101,77 @@ except ImportError:
     print("Please install google-generativeai: pip install google-generativeai")
     genai = None
 
+# Worker threads available for blocking SDK and model calls
+THREADPOOL_SIZE = int(os.getenv("DERMA_THREADPOOL_SIZE", "64"))
+
+# Server processes. Each one holds its own model copy, analysis cache and micro-batcher,
+# so a single worker is the default for model serving.
+SERVER_WORKERS = max(1, int(os.getenv("DERMA_WORKERS") or 1))
+
+def configure_threadpool():
+    """Raise the AnyIO thread limiter so offloaded calls don't queue behind the default 40 tokens."""
+    import anyio.to_thread
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+
+def log_pillow_build():
+    """Log whether the Pillow-SIMD build is installed so a silent fallback to stock Pillow is visible."""
+    try:
+        import PIL
+    except ImportError:
+        return
+    simd = ".post" in PIL.__version__
+    print(f"Pillow {PIL.__version__} ({'SIMD build' if simd else 'stock build; install pillow-simd for faster image ops'})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Configure the server and warm the models before serving traffic.
+
+    Model warm-up failures are logged rather than raised so the Gemini endpoints stay available;
+    the model endpoints then load lazily on first use as before.
+    """
+    configure_threadpool()
+    log_pillow_build()
+
+    app.state.model_path = default_model_path()
+    app.state.model = None
+    app.state.inference = None
+    if torch is not None:
+        try:
+            app.state.model = await run_in_threadpool(warm_up_pytorch_model, app.state.model_path)
+        except Exception as e:
+            print(f"PyTorch model warm-up skipped: {e}")
+        try:
+            app.state.inference = await run_in_threadpool(warm_up_inference_backend, app.state.model_path)
+        except Exception as e:
+            print(f"Inference backend warm-up skipped: {e}")
+    yield
+
 app = FastAPI(
     title="DermaVision AI Backend",
     description="AI-powered skin analysis using Google Gemini Vision",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for frontend communication
+# Comma-separated origins; defaults to the local Next.js dev server
+CORS_ORIGINS = [o.strip() for o in os.getenv("DERMA_CORS_ORIGINS", "http://localhost:3000").split(",") if o.strip()]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=CORS_ORIGINS,
+    allow_credentials=False,
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
+    max_age=86400,
 )
 
+# Compress JSON responses (base64 heatmaps compress well); Brotli itself falls back to gzip for older clients
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Request/Response Models
 class AnalysisRequest(BaseModel):
     image_base64: str
@@ -98,19 +206,92 @@ class AnalysisResponse(BaseModel):
     confidence: float
     error: Optional[str] = None
 
+# Canonical probability keys, in response model field order
+TIER1_KEYS = tuple(Tier1Results.model_fields)
+TIER2_KEYS = tuple(Tier2Results.model_fields)
+
+def normalize_probabilities(probs: dict, keys: tuple) -> dict:
+    """Scale the probabilities for `keys` so they sum to 1."""
+    if np is not None:
+        v = np.fromiter((probs[k] for k in keys), dtype=np.float64, count=len(keys))
+        v /= v.sum() or 1.0
+        return dict(zip(keys, v.tolist()))
+    total = sum(float(probs[k]) for k in keys) or 1.0
+    return {k: float(probs[k]) / total for k in keys}
+
 # Gemini configuration
 GEMINI_MODEL = "gemini-2.0-flash"
 
+@lru_cache(maxsize=1)
+def _get_gemini_model(api_key: str):
+    """Build the Gemini model once per API key and reuse it across requests."""
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
 def configure_gemini():
     """Configure Google Gemini API with the API key from environment."""
     api_key = os.getenv("GOOGLE_GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY")
     if not api_key:
         return None
     if genai:
-        genai.configure(api_key=api_key)
-        return genai.GenerativeModel(GEMINI_MODEL)
+        return _get_gemini_model(api_key)
     return None
 
+# In-process analysis response cache: DERMA_ANALYSIS_CACHE is "enabled" (default) or "disabled"
+ANALYSIS_CACHE_MODE = os.getenv("DERMA_ANALYSIS_CACHE", "enabled").lower()
+if ANALYSIS_CACHE_MODE not in ("enabled", "disabled"):
+    raise ValueError(f"DERMA_ANALYSIS_CACHE must be 'enabled' or 'disabled', got {ANALYSIS_CACHE_MODE!r}")
+ANALYSIS_CACHE_ENABLED = ANALYSIS_CACHE_MODE == "enabled"
+ANALYSIS_CACHE_MAXSIZE = int(os.getenv("DERMA_ANALYSIS_CACHE_SIZE", "4096"))
+_analysis_cache: "OrderedDict[str, dict]" = OrderedDict()
+
+# Chunk size for hashing/reading spooled uploads
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Raw image bytes, or a binary file object such as an UploadFile's spooled temp file
+ImageSource = Union[bytes, BinaryIO]
+
+def read_image_source(image: ImageSource) -> bytes:
+    """Return the bytes of an image source, rewinding file objects first."""
+    if isinstance(image, bytes):
+        return image
+    image.seek(0)
+    return image.read()
+
+def analysis_cache_key(image: ImageSource, language: str) -> str:
+    """Content-addressed key for an analysis: SHA256 of image, language and model.
+
+    File objects are hashed in chunks, so uploads need not be read into memory on a cache hit.
+    """
+    if isinstance(image, bytes):
+        h = hashlib.sha256(image)
+    else:
+        h = hashlib.sha256()
+        image.seek(0)
+        while chunk := image.read(UPLOAD_CHUNK_SIZE):
+            h.update(chunk)
+    h.update(language.encode("utf-8"))
+    h.update(GEMINI_MODEL.encode("utf-8"))
+    return h.hexdigest()
+
+def get_cached_analysis(key: str) -> Optional[dict]:
+    """Return a cached parsed analysis, or None on a miss or when caching is disabled."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+    analysis = _analysis_cache.get(key)
+    if analysis is not None:
+        _analysis_cache.move_to_end(key)
+    return analysis
+
+def store_cached_analysis(key: str, analysis: dict) -> None:
+    """Store a parsed analysis, evicting the least recently used entry when full."""
+    if not ANALYSIS_CACHE_ENABLED or ANALYSIS_CACHE_MAXSIZE <= 0:
+        return
+    _analysis_cache[key] = analysis
+    _analysis_cache.move_to_end(key)
+    while len(_analysis_cache) > ANALYSIS_CACHE_MAXSIZE:
+        _analysis_cache.popitem(last=False)
+
 def create_analysis_prompt(language: str) -> str:
     """Create a detailed prompt for skin lesion analysis."""
     language_instructions = {
@@ -163,34 +344,37 @@ IMPORTANT:
 
 Analyze the image now:"""
 
+def extract_json_object(text: str) -> Optional[dict]:
+    """Parse the outermost {...} span of an LLM response, or return None if there is none."""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return None
+    json_str = text[start:end + 1]
+    return orjson.loads(json_str) if orjson else json.loads(json_str)
+
 def parse_gemini_response(response_text: str) -> dict:
     """Parse and validate Gemini's JSON response."""
     # Try to extract JSON from the response
-    json_match = re.search(r'\{[\s\S]*\}', response_text)
-    if not json_match:
+    data = extract_json_object(response_text)
+    if data is None:
         raise ValueError("No JSON found in response")
     
-    json_str = json_match.group()
-    data = json.loads(json_str)
+    # Normalize tier1 and tier2 probabilities to sum to 1
+    tier1 = normalize_probabilities(data.get("tier1", {}), TIER1_KEYS)
+    tier2 = normalize_probabilities(data.get("tier2", {}), TIER2_KEYS)
     
-    # Normalize tier1 probabilities to sum to 1
-    tier1 = data.get("tier1", {})
-    tier1_total = sum(tier1.values()) or 1
-    for key in tier1:
-        tier1[key] = tier1[key] / tier1_total
-    
-    # Normalize tier2 probabilities to sum to 1
-    tier2 = data.get("tier2", {})
-    tier2_total = sum(tier2.values()) or 1
-    for key in tier2:
-        tier2[key] = tier2[key] / tier2_total
+    # Coerce the free-form fields here, since responses are built without re-validation
+    recommendations = data.get("recommendations", ["Consult a dermatologist for professional evaluation."])
+    if isinstance(recommendations, str):
+        recommendations = [recommendations]
     
     return {
         "tier1": tier1,
         "tier2": tier2,
-        "description": data.get("description", "Analysis complete."),
-        "recommendations": data.get("recommendations", ["Consult a dermatologist for professional evaluation."]),
-        "confidence": min(1.0, max(0.0, data.get("confidence", 0.7)))
+        "description": str(data.get("description", "Analysis complete.")),
+        "recommendations": [str(r) for r in recommendations],
+        "confidence": min(1.0, max(0.0, float(data.get("confidence", 0.7))))
     }
 
 def get_fallback_analysis() -> dict:
@@ -205,8 +389,7 @@ def get_fallback_analysis() -> dict:
         "malignant": random.uniform(0.1, 0.35),
         "benign": random.uniform(0.2, 0.4),
     }
-    tier1_total = sum(tier1_raw.values())
-    tier1 = {k: v / tier1_total for k, v in tier1_raw.items()}
+    tier1 = normalize_probabilities(tier1_raw, TIER1_KEYS)
     
     tier2_raw = {
         "melanoma": random.uniform(0.05, 0.25),
@@ -220,8 +403,7 @@ def get_fallback_analysis() -> dict:
         "tinea": random.uniform(0.02, 0.06),
         "warts": random.uniform(0.01, 0.05),
     }
-    tier2_total = sum(tier2_raw.values())
-    tier2 = {k: v / tier2_total for k, v in tier2_raw.items()}
+    tier2 = normalize_probabilities(tier2_raw, TIER2_KEYS)
     
     return {
         "tier1": tier1,
@@ -237,30 +419,48 @@ def get_fallback_analysis() -> dict:
     }
 
 
+def encode_jpeg_data_url(rgb_img, quality: int = 85) -> str:
+    """Encode an RGB PIL image as a JPEG data URL, using libjpeg-turbo when available."""
+    if simplejpeg is not None and np is not None:
+        arr = np.ascontiguousarray(np.asarray(rgb_img))
+        jpeg_bytes = simplejpeg.encode_jpeg(arr, quality=quality, colorspace='RGB')
+    else:
+        out_buf = BytesIO()
+        rgb_img.save(out_buf, format='JPEG', quality=quality)
+        jpeg_bytes = out_buf.getvalue()
+    b64 = base64.b64encode(jpeg_bytes).decode('utf-8')
+    return f'data:image/jpeg;base64,{b64}'
+
+
+HEATMAP_PEAK_ALPHA = 0.47
+
+
+def radial_falloff_mask(w: int, h: int):
+    """Return an (h, w) float32 alpha mask peaking at ~0.47 in the centre and fading outwards.
+
+    The Gaussian is separable, so it is built as the outer product of two 1-D falloffs.
+    """
+    gx = np.exp(-(((np.arange(w, dtype=np.float32) - w / 2) / (w * 0.35)) ** 2))
+    gy = np.exp(-(((np.arange(h, dtype=np.float32) - h / 2) / (h * 0.35)) ** 2))
+    return np.outer(gy * HEATMAP_PEAK_ALPHA, gx).astype(np.float32, copy=False)
+
+
 def generate_heatmap_overlay(image_bytes: bytes) -> str:
     """Create a simple heatmap overlay as a base64 data URL (placeholder for CAM/Grad-CAM).
 
-    This function draws a translucent red overlay centered on the image to simulate a heatmap.
+    This function blends a translucent red radial gradient centered on the image to simulate a heatmap.
     """
     try:
-        from PIL import Image, ImageDraw, ImageFilter
-        img = Image.open(BytesIO(image_bytes)).convert('RGBA')
+        from PIL import Image
+        img = Image.open(BytesIO(image_bytes)).convert('RGB')
         w, h = img.size
 
-        overlay = Image.new('RGBA', img.size, (255, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        # Draw an elliptical gradient-like shape in the center
-        bbox = (w * 0.1, h * 0.1, w * 0.9, h * 0.9)
-        draw.ellipse(bbox, fill=(255, 0, 0, 120))
-        overlay = overlay.filter(ImageFilter.GaussianBlur(radius=min(w,h)/20))
-
-        blended = Image.alpha_composite(img, overlay)
-        out_buf = BytesIO()
-        blended.convert('RGB').save(out_buf, format='JPEG')
-        out_buf.seek(0)
-        b64 = base64.b64encode(out_buf.read()).decode('utf-8')
-        return f'data:image/jpeg;base64,{b64}'
+        # out = orig * (1 - a) + red * a, blended in place; red only adds to the R channel
+        blended = np.array(img, dtype=np.float32)
+        alpha = radial_falloff_mask(w, h)
+        blended *= (1.0 - alpha)[..., None]
+        blended[..., 0] += 255.0 * alpha
+        return encode_jpeg_data_url(Image.fromarray(blended.astype(np.uint8)))
     except Exception as e:
         # on failure, return original image as fallback
         return f'data:image/jpeg;base64,{base64.b64encode(image_bytes).decode("utf-8")}'
@@ -275,11 +475,21 @@ def find_last_conv_module(model):
     return last_conv
 
 
+# Grad-CAM registers hooks on the shared PyTorch model, so no other forward on that model
+# (Grad-CAM or /infer, eager or compiled) may run while they are attached
+_torch_model_lock = threading.Lock()
+
+
 def compute_gradcam(model, input_tensor, target_index: int = None):
     """Compute Grad-CAM for the given model and input tensor.
 
     Returns a numpy array heatmap (H x W) normalized 0..1.
     """
+    with _torch_model_lock:
+        return _compute_gradcam_locked(model, input_tensor, target_index)
+
+
+def _compute_gradcam_locked(model, input_tensor, target_index: int = None):
     feature_maps = None
     gradients = None
 
@@ -296,23 +506,28 @@ def compute_gradcam(model, input_tensor, target_index: int = None):
         raise RuntimeError('No Conv2d module found for Grad-CAM')
 
     fh = target_module.register_forward_hook(forward_hook)
-    bh = target_module.register_backward_hook(backward_hook)
+    bh = target_module.register_full_backward_hook(backward_hook)
 
     try:
         model.zero_grad()
         model.eval()
-        out = model(input_tensor)
+        input_tensor = input_tensor.to(DEVICE, non_blocking=True)
+        # FP16 autocast only pays off on CUDA; CPU stays in FP32
+        with torch.autocast(device_type=DEVICE, dtype=torch.float16, enabled=DEVICE == 'cuda'):
+            out = model(input_tensor)
         if isinstance(out, (tuple, list)):
             out = out[0]
         if target_index is None:
             target_index = int(out.argmax(dim=1).item())
-        score = out[0, target_index]
+        score = out[0, target_index].float()
         score.backward(retain_graph=False)
 
         if feature_maps is None or gradients is None:
             raise RuntimeError('Failed to capture feature maps or gradients')
 
         # weights: global average pooling of gradients
+        feature_maps = feature_maps.float()
+        gradients = gradients.float()
         weights = gradients.mean(dim=(2, 3), keepdim=True)  # BxCx1x1
         cam = (weights * feature_maps).sum(dim=1, keepdim=True)  # Bx1xHxW
         cam = F.relu(cam)
@@ -346,11 +561,7 @@ def make_heatmap_overlay_from_cam(cam_np, orig_image_bytes):
     heat.putalpha(cam_img)
 
     blended = Image.alpha_composite(orig, heat)
-    out_buf = BytesIO()
-    blended.convert('RGB').save(out_buf, format='JPEG')
-    out_buf.seek(0)
-    b64 = base64.b64encode(out_buf.read()).decode('utf-8')
-    return f'data:image/jpeg;base64,{b64}'
+    return encode_jpeg_data_url(blended.convert('RGB'))
 
 
 def generate_report_via_llm(analysis: dict, symptoms: list, image_base64: str, language: str = 'en') -> dict:
@@ -369,9 +580,8 @@ def generate_report_via_llm(analysis: dict, symptoms: list, image_base64: str, l
             response = model.generate_content([llm_prompt])
             text = getattr(response, 'text', None) or str(response)
             # extract JSON
-            m = re.search(r'\{[\s\S]*\}', text)
-            if m:
-                report_json = json.loads(m.group())
+            report_json = extract_json_object(text)
+            if report_json is not None:
                 return report_json
         except Exception:
             pass
@@ -404,16 +614,50 @@ def generate_report_via_llm(analysis: dict, symptoms: list, image_base64: str, l
 # -----------------------
 
 MODEL_PATH_DEFAULT = os.path.join(os.path.dirname(__file__), '..', 'dermascan_efficientnet_95.pth')
+ONNX_PROVIDERS = ('OpenVINOExecutionProvider', 'CUDAExecutionProvider', 'CPUExecutionProvider')
+
+
+def default_model_path() -> str:
+    """Return the server's configured model file (DERMA_MODEL_PATH or the bundled default)."""
+    return os.path.expanduser(os.getenv('DERMA_MODEL_PATH') or MODEL_PATH_DEFAULT)
+
+
+# ImageNet normalization in 0..255 pixel units, pre-broadcast over HxWxC
+if np is not None:
+    IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32) * 255
+    IMAGENET_INV_STD = 1.0 / (np.array([0.229, 0.224, 0.225], dtype=np.float32) * 255)
+
+# Micro-batching of concurrent /infer requests
+INFER_BATCH_SIZE = int(os.getenv('DERMA_BATCH_SIZE', '8'))
+INFER_BATCH_WAIT_MS = float(os.getenv('DERMA_BATCH_WAIT_MS', '8'))
 
+# Run on GPU when present; on CPU split the cores across server workers unless overridden
+DEVICE = 'cuda' if torch is not None and torch.cuda.is_available() else 'cpu'
+if torch is not None and DEVICE == 'cpu':
+    torch.set_num_threads(int(os.getenv('DERMA_TORCH_THREADS') or max(1, (os.cpu_count() or 1) // SERVER_WORKERS)))
 
-def image_preprocess_pil(img: Image.Image, size: int = 224):
-    """Simple preprocessing: resize, center-crop, normalize."""
-    tf = transforms.Compose([
-        transforms.Resize((size, size)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
-    return tf(img).unsqueeze(0)
+
+def image_preprocess_bytes(img: ImageSource, size: int = 224):
+    """Decode, resize and normalize image bytes (or a binary file) into a 1x3xHxW float32 array in one pass.
+
+    Uses OpenCV when available, otherwise Pillow for decode/resize.
+    """
+    if cv2 is not None:
+        # Ignore EXIF orientation like the Pillow paths do, so Grad-CAM lines up with the overlay image
+        flags = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        arr = cv2.imdecode(np.frombuffer(read_image_source(img), np.uint8), flags)
+        if arr is None:
+            raise ValueError('Could not decode image')
+        arr = cv2.resize(arr, (size, size), interpolation=cv2.INTER_AREA)[:, :, ::-1]
+    else:
+        if isinstance(img, bytes):
+            img = BytesIO(img)
+        else:
+            img.seek(0)
+        pil_img = Image.open(img).convert('RGB').resize((size, size), Image.BILINEAR)
+        arr = np.asarray(pil_img)
+    arr = (arr.astype(np.float32) - IMAGENET_MEAN) * IMAGENET_INV_STD
+    return np.ascontiguousarray(arr.transpose(2, 0, 1))[None]
 
 
 @lru_cache(maxsize=1)
@@ -436,7 +680,7 @@ def load_pytorch_model(path: str):
     try:
         model = torch.jit.load(path, map_location='cpu')
         model.eval()
-        return model, None
+        return model.to(DEVICE), None
     except Exception:
         pass
 
@@ -446,7 +690,7 @@ def load_pytorch_model(path: str):
     # If saved an entire module
     if hasattr(data, 'eval'):
         data.eval()
-        return data, None
+        return data.to(DEVICE), None
 
     # 3) Assume state_dict
     if isinstance(data, dict):
@@ -474,7 +718,7 @@ def load_pytorch_model(path: str):
                 model = timm.create_model(name, pretrained=False, num_classes=num_classes)
                 model.load_state_dict(state_dict, strict=False)
                 model.eval()
-                return model, None
+                return model.to(DEVICE), None
             except Exception:
                 model = None
 
@@ -484,19 +728,300 @@ def load_pytorch_model(path: str):
     raise RuntimeError('Unknown model file format')
 
 
-def predict_from_pil_image(model, pil_img: Image.Image, topk: int = 5):
-    tensor = image_preprocess_pil(pil_img)
-    with torch.no_grad():
+def onnx_path_for(model_path: str) -> str:
+    """Return the ONNX file used in place of `model_path`: its sibling .onnx.
+
+    DERMA_ONNX_PATH overrides this only for the configured default model, so an explicit
+    `model_path` passed to /infer is never silently swapped for a different model.
+    """
+    model_path = os.path.expanduser(model_path)
+    env_onnx_path = os.getenv('DERMA_ONNX_PATH')
+    if env_onnx_path and os.path.abspath(model_path) == os.path.abspath(default_model_path()):
+        return os.path.expanduser(env_onnx_path)
+    return os.path.splitext(model_path)[0] + '.onnx'
+
+
+def is_stale(derived_path: str, source_path: str) -> bool:
+    """True (with a warning) when `derived_path` is older than the `source_path` it was built from."""
+    if not os.path.exists(source_path) or os.path.getmtime(derived_path) >= os.path.getmtime(source_path):
+        return False
+    print(f"Ignoring stale {derived_path}: older than {source_path}; re-export it")
+    return True
+
+
+def export_onnx_model(model_path: Optional[str] = None, onnx_path: Optional[str] = None, size: int = 224) -> str:
+    """One-time export of the PyTorch model (default: the configured model) to ONNX with a dynamic batch axis.
+
+    Returns the ONNX path.
+    """
+    model_path = model_path or default_model_path()
+    onnx_path = onnx_path or onnx_path_for(model_path)
+    model, _ = load_pytorch_model(model_path)
+    dummy = torch.zeros(1, 3, size, size, device=DEVICE)
+    torch.onnx.export(
+        model, dummy, onnx_path,
+        opset_version=17,
+        input_names=['input'],
+        output_names=['logits'],
+        dynamic_axes={'input': {0: 'N'}, 'logits': {0: 'N'}},
+    )
+    return onnx_path
+
+
+def int8_path_for(onnx_path: str) -> str:
+    """Return the int8-quantized sibling of an ONNX file (model.onnx -> model.int8.onnx)."""
+    return os.path.splitext(onnx_path)[0] + '.int8.onnx'
+
+
+def verified_marker_for(int8_path: str) -> str:
+    """Return the marker file written once an int8 model has passed calibration."""
+    return int8_path + '.verified'
+
+
+def onnx_candidates(model_path: str) -> list:
+    """ONNX files that may serve `model_path`, in preference order.
+
+    A calibrated int8 model (see quantize_onnx_model) comes first unless DERMA_ONNX_INT8=0, then the FP32 export.
+    Unverified int8 files and exports older than their source are never served.
+    """
+    if ort is None:
+        return []
+    model_path = os.path.expanduser(model_path)
+    onnx_path = onnx_path_for(model_path)
+    if not os.path.exists(onnx_path) or is_stale(onnx_path, model_path):
+        return []
+    candidates = [onnx_path]
+    int8_path = int8_path_for(onnx_path)
+    if (os.getenv('DERMA_ONNX_INT8', '1') != '0'
+            and os.path.exists(int8_path)
+            and os.path.exists(verified_marker_for(int8_path))
+            and not is_stale(int8_path, onnx_path)):
+        candidates.insert(0, int8_path)
+    return candidates
+
+
+def quantize_onnx_model(calibration_images: Sequence[str], onnx_path: Optional[str] = None, int8_path: Optional[str] = None,
+                        min_top1_agreement: float = 0.99) -> str:
+    """Write a dynamically int8-quantized copy of the ONNX model and verify it. Returns the int8 path.
+
+    The int8 model is only marked as servable when its top-1 prediction matches the FP32 model on at
+    least `min_top1_agreement` of `calibration_images` (file paths); otherwise it is discarded.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    if not calibration_images:
+        raise ValueError('calibration_images are required to verify the int8 model')
+
+    onnx_path = onnx_path or onnx_path_for(default_model_path())
+    int8_path = int8_path or int8_path_for(onnx_path)
+    marker_path = verified_marker_for(int8_path)
+    if os.path.exists(marker_path):
+        os.remove(marker_path)
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+
+    fp32 = ort.InferenceSession(onnx_path, providers=['CPUExecutionProvider'])
+    int8 = ort.InferenceSession(int8_path, providers=['CPUExecutionProvider'])
+    matches = 0
+    for image_path in calibration_images:
+        with open(image_path, 'rb') as f:
+            inputs = image_preprocess_bytes(f.read())
+        top_fp32 = int(run_onnx_batch(fp32, inputs)[0].argmax())
+        top_int8 = int(run_onnx_batch(int8, inputs)[0].argmax())
+        matches += top_fp32 == top_int8
+    agreement = matches / len(calibration_images)
+    if agreement < min_top1_agreement:
+        os.remove(int8_path)
+        raise RuntimeError(f'int8 top-1 agreement {agreement:.3f} is below {min_top1_agreement}; int8 model discarded')
+
+    with open(marker_path, 'w') as f:
+        f.write(f'top1_agreement={agreement:.4f} images={len(calibration_images)}\n')
+    return int8_path
+
+
+@lru_cache(maxsize=1)
+def load_onnx_session(path: str):
+    """Create an ONNX Runtime session using the fastest available execution provider."""
+    if ort is None:
+        raise RuntimeError("onnxruntime is not installed in the Python environment")
+    available = ort.get_available_providers()
+    providers = [p for p in ONNX_PROVIDERS if p in available]
+    return ort.InferenceSession(path, providers=providers)
+
+
+def topk_predictions(probs, topk: int = 5):
+    """Return the top-k class indices and probabilities from a 1-D probability array."""
+    idxs = np.argsort(probs)[::-1][:topk]
+    return [{'class_index': int(i), 'probability': float(probs[i])} for i in idxs]
+
+
+def run_torch_batch(model, batch):
+    """Run an NxCxHxW float32 array through a PyTorch model and return NxK softmax probabilities."""
+    tensor = torch.from_numpy(batch).to(DEVICE, non_blocking=True)
+    with _torch_model_lock, torch.no_grad():
         out = model(tensor)
         if isinstance(out, tuple) or isinstance(out, list):
             out = out[0]
-        probs = F.softmax(out, dim=1).cpu().numpy()[0]
+        return F.softmax(out, dim=1).cpu().numpy()
 
-    # produce topk indices and probabilities
-    import numpy as np
-    idxs = np.argsort(probs)[::-1][:topk]
-    return [{'class_index': int(i), 'probability': float(probs[i])} for i in idxs]
 
+def run_onnx_batch(session, batch):
+    """Run an NxCxHxW float32 array through an ONNX Runtime session and return NxK softmax probabilities."""
+    logits = session.run(None, {session.get_inputs()[0].name: batch})[0].astype(np.float64)
+    exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def compile_for_inference(model):
+    """Wrap the model with torch.compile for graph-level fusion (DERMA_TORCH_COMPILE=0 disables).
+
+    Scripted models and PyTorch builds without torch.compile are returned unchanged.
+    """
+    if os.getenv('DERMA_TORCH_COMPILE', '1') == '0' or not hasattr(torch, 'compile'):
+        return model
+    if isinstance(model, torch.jit.ScriptModule):
+        return model
+    return torch.compile(model, mode='reduce-overhead', fullgraph=False)
+
+
+def load_inference_backend(model_path: str, compiled: bool = False):
+    """Return (batch runner, model file used) for `model_path` (blocking on first load).
+
+    Prefers an exported (verified int8, then FP32) ONNX model via ONNX Runtime, moving on to the next candidate
+    if a session cannot be built; falls back to the PyTorch .pth loader, optionally wrapped with torch.compile.
+    Grad-CAM always uses the eager model, since it relies on module hooks.
+    """
+    for onnx_path in onnx_candidates(model_path):
+        try:
+            return partial(run_onnx_batch, load_onnx_session(onnx_path)), onnx_path
+        except Exception as e:
+            print(f"ONNX Runtime could not load {onnx_path}, trying next backend: {e}")
+    model, _ = load_pytorch_model(model_path)
+    if compiled:
+        model = compile_for_inference(model)
+    return partial(run_torch_batch, model), model_path
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-image requests into one batched model call.
+
+    A background task waits up to `max_wait_ms` after the first queued input (or until
+    `max_batch_size` inputs arrive), runs the batch in the threadpool and resolves each
+    caller's future with its row of probabilities.
+    """
+
+    def __init__(self, run_batch, max_batch_size: int = INFER_BATCH_SIZE, max_wait_ms: float = INFER_BATCH_WAIT_MS):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, inputs):
+        """Queue a 1xCxHxW array and wait for its 1-D probability vector."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((inputs, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                probs = await run_in_threadpool(self.run_batch, np.concatenate([inputs for inputs, _ in batch]))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), row in zip(batch, probs):
+                if not future.done():
+                    future.set_result(row)
+
+
+# One batcher per served model file
+_batchers: dict = {}
+
+
+def get_batcher(model_file: str, run_batch) -> MicroBatcher:
+    batcher = _batchers.get(model_file)
+    if batcher is None:
+        batcher = _batchers[model_file] = MicroBatcher(run_batch)
+    return batcher
+
+
+def warm_up_pytorch_model(model_path: str):
+    """Load the PyTorch model and run a dummy forward so first requests don't pay for it (blocking)."""
+    model, _ = load_pytorch_model(model_path)
+    with torch.no_grad():
+        model(torch.zeros(1, 3, 224, 224, device=DEVICE))
+    return model
+
+
+def warm_up_inference_backend(model_path: str):
+    """Load the /infer backend and run dummy batches through it (blocking). Returns (batch runner, model file).
+
+    Every micro-batch size from 1 to INFER_BATCH_SIZE is run (twice, for CUDA graph capture) on fixed 224x224
+    inputs, so torch.compile specializes up front instead of recompiling on the request path while the
+    batcher stalls. If compilation fails the eager model is used.
+    """
+    try:
+        run_batch, model_file = load_inference_backend(model_path, compiled=True)
+        for batch_size in range(1, max(1, INFER_BATCH_SIZE) + 1):
+            dummy = np.zeros((batch_size, 3, 224, 224), dtype=np.float32)
+            for _ in range(2):
+                run_batch(dummy)
+    except Exception as e:
+        print(f"torch.compile warm-up failed, using eager model: {e}")
+        run_batch, model_file = load_inference_backend(model_path)
+        run_batch(np.zeros((1, 3, 224, 224), dtype=np.float32))
+    return run_batch, model_file
+
+
+async def infer_from_bytes(img_source: ImageSource, model_path: str, topk: int = 5):
+    """Decode an image and return (top-k predictions, model file used), micro-batched with concurrent requests."""
+    preloaded = getattr(app.state, 'inference', None)
+    if preloaded is not None and model_path == app.state.model_path:
+        run_batch, model_file = preloaded
+    else:
+        run_batch, model_file = await run_in_threadpool(load_inference_backend, model_path)
+    inputs = await run_in_threadpool(image_preprocess_bytes, img_source)
+    probs = await get_batcher(model_file, run_batch).submit(inputs)
+    return topk_predictions(probs, topk), model_file
+
+
+def gradcam_heatmap_from_bytes(img_bytes: bytes, model=None) -> Optional[str]:
+    """Produce a Grad-CAM heatmap data URL, falling back to the placeholder overlay (blocking).
+
+    Uses `model` (the model preloaded at startup) when given, otherwise loads it on demand.
+    """
+    if torch is None:
+        return None
+    try:
+        # attempt to load model and compute grad-cam
+        if model is None:
+            model, _ = load_pytorch_model(default_model_path())
+        # preprocess image to tensor
+        inp = torch.from_numpy(image_preprocess_bytes(img_bytes))
+        cam = compute_gradcam(model, inp)
+        # cam may be HxW for single instance
+        if cam.ndim == 3:
+            cam = cam[0]
+        return make_heatmap_overlay_from_cam(cam, img_bytes)
+    except Exception:
+        return generate_heatmap_overlay(img_bytes)
 
 
 @app.get("/")
@@ -508,6 +1033,86 @@ async def root():
         "gemini_configured": bool(os.getenv("GOOGLE_GEMINI_API_KEY") or os.getenv("GEMINI_API_KEY"))
     }
 
+def decode_image_base64(image_data: str) -> bytes:
+    """Decode a base64 image, accepting either raw base64 or a data URL."""
+    if "," in image_data:
+        image_data = image_data.split(",", 1)[1]
+    return base64.b64decode(image_data)
+
+def build_analysis_response(analysis: dict, description: Optional[str] = None, error: Optional[str] = None) -> AnalysisResponse:
+    """Assemble the response from an analysis dict without re-validating it.
+
+    Only for dicts from parse_gemini_response/get_fallback_analysis, which already normalize and coerce every field.
+    """
+    # No validation happens downstream either: FastAPI serializes model_construct instances as-is even with
+    # response_model set, so any new field must be coerced in parse_gemini_response first.
+    return AnalysisResponse.model_construct(
+        success=True,
+        tier1=Tier1Results.model_construct(**analysis["tier1"]),
+        tier2=Tier2Results.model_construct(**analysis["tier2"]),
+        ai_malignant_prob=analysis["tier1"]["malignant"],
+        description=analysis["description"] if description is None else description,
+        recommendations=analysis["recommendations"],
+        confidence=analysis["confidence"],
+        error=error
+    )
+
+async def _analyze_bytes(image: ImageSource, language: str) -> AnalysisResponse:
+    """Analyze raw image bytes (or a spooled upload) with Gemini, falling back to a simulated analysis on any error."""
+    try:
+        model = configure_gemini()
+        
+        # Serve repeated submissions of the same image from the cache
+        analysis = None
+        cache_key = None
+        if model is not None and ANALYSIS_CACHE_ENABLED:
+            if isinstance(image, bytes):
+                cache_key = analysis_cache_key(image, language)
+            else:
+                cache_key = await run_in_threadpool(analysis_cache_key, image, language)
+            analysis = get_cached_analysis(cache_key)
+        
+        if analysis is None:
+            if model is None:
+                # Return fallback analysis when Gemini is not configured
+                analysis = get_fallback_analysis()
+                return build_analysis_response(
+                    analysis,
+                    description=analysis["description"] + " (Demo mode - Gemini API not configured)"
+                )
+            
+            # Gemini takes inline bytes, so uploads are only materialized on a miss
+            if isinstance(image, bytes):
+                image_bytes = image
+            else:
+                image_bytes = await run_in_threadpool(read_image_source, image)
+            
+            # Create the prompt
+            prompt = create_analysis_prompt(language)
+            
+            # Send to Gemini Vision API (blocking SDK call, run off the event loop)
+            response = await run_in_threadpool(model.generate_content, [
+                prompt,
+                {
+                    "mime_type": "image/jpeg",
+                    "data": image_bytes
+                }
+            ])
+            
+            # Parse the response
+            analysis = parse_gemini_response(response.text)
+            if cache_key is not None:
+                store_cached_analysis(cache_key, analysis)
+        
+        return build_analysis_response(analysis)
+        
+    except Exception as e:
+        return fallback_analysis_response(e)
+
+def fallback_analysis_response(error: Exception) -> AnalysisResponse:
+    """Build a simulated analysis response that records why the fallback was used."""
+    return build_analysis_response(get_fallback_analysis(), error=f"Using fallback: {str(error)}")
+
 @app.post("/analyze", response_model=AnalysisResponse)
 async def analyze_skin_lesion(request: AnalysisRequest):
     """
@@ -520,68 +1125,13 @@ async def analyze_skin_lesion(request: AnalysisRequest):
     along with description and recommendations.
     """
     try:
-        model = configure_gemini()
-        
-        if model is None:
-            # Return fallback analysis when Gemini is not configured
-            analysis = get_fallback_analysis()
-            return AnalysisResponse(
-                success=True,
-                tier1=Tier1Results(**analysis["tier1"]),
-                tier2=Tier2Results(**analysis["tier2"]),
-                ai_malignant_prob=analysis["tier1"]["malignant"],
-                description=analysis["description"] + " (Demo mode - Gemini API not configured)",
-                recommendations=analysis["recommendations"],
-                confidence=analysis["confidence"]
-            )
-        
-        # Decode base64 image
-        image_data = request.image_base64
-        if "," in image_data:
-            image_data = image_data.split(",")[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        
-        # Create the prompt
-        prompt = create_analysis_prompt(request.language)
-        
-        # Send to Gemini Vision API
-        response = model.generate_content([
-            prompt,
-            {
-                "mime_type": "image/jpeg",
-                "data": image_bytes
-            }
-        ])
-        
-        # Parse the response
-        analysis = parse_gemini_response(response.text)
-        
-        return AnalysisResponse(
-            success=True,
-            tier1=Tier1Results(**analysis["tier1"]),
-            tier2=Tier2Results(**analysis["tier2"]),
-            ai_malignant_prob=analysis["tier1"]["malignant"],
-            description=analysis["description"],
-            recommendations=analysis["recommendations"],
-            confidence=analysis["confidence"]
-        )
-        
+        image_bytes = decode_image_base64(request.image_base64)
     except Exception as e:
-        # Return fallback on any error
-        analysis = get_fallback_analysis()
-        return AnalysisResponse(
-            success=True,
-            tier1=Tier1Results(**analysis["tier1"]),
-            tier2=Tier2Results(**analysis["tier2"]),
-            ai_malignant_prob=analysis["tier1"]["malignant"],
-            description=analysis["description"],
-            recommendations=analysis["recommendations"],
-            confidence=analysis["confidence"],
-            error=f"Using fallback: {str(e)}"
-        )
-
-@app.post("/analyze-upload")
+        # Return fallback on undecodable input
+        return fallback_analysis_response(e)
+    return await _analyze_bytes(image_bytes, request.language)
+
+@app.post("/analyze-upload", response_model=AnalysisResponse)
 async def analyze_uploaded_image(file: UploadFile = File(...), language: str = "en"):
     """
     Alternative endpoint that accepts file uploads directly.
@@ -589,16 +1139,15 @@ async def analyze_uploaded_image(file: UploadFile = File(...), language: str = "
     ENDPOINT: POST /analyze-upload
     FORM DATA: file (image), language (string)
     """
-    contents = await file.read()
-    image_base64 = base64.b64encode(contents).decode("utf-8")
-    
-    request = AnalysisRequest(image_base64=image_base64, language=language)
-    return await analyze_skin_lesion(request)
+    # UploadFile is already spooled (memory, then disk); hand the file object through as-is
+    return await _analyze_bytes(file.file, language)
 
 
 @app.post("/infer")
 async def infer_model(file: UploadFile | None = File(None), image_base64: str | None = None, model_path: str | None = None, topk: int = 5):
-    """Run the provided PyTorch .pth model on the input image and return class probabilities.
+    """Run the classifier on the input image and return class probabilities.
+
+    Uses the exported ONNX model (next to the .pth, or DERMA_ONNX_PATH) when present, else the PyTorch .pth model.
 
     Accepts either multipart file upload (`file`) or `image_base64` in POST body form data.
     Optionally pass `model_path` (absolute or workspace-relative). If omitted, a default path next to the script is used.
@@ -606,33 +1155,25 @@ async def infer_model(file: UploadFile | None = File(None), image_base64: str |
     if torch is None:
         raise HTTPException(status_code=500, detail="PyTorch or dependencies not installed on server")
 
-    # Read image bytes
-    img_bytes = None
+    # Image source: the spooled upload file (decoded in place) or decoded base64 bytes
+    img_source = None
     try:
         if file is not None:
-            contents = await file.read()
-            img_bytes = contents
+            img_source = file.file
         elif image_base64:
-            b = image_base64
-            if "," in b:
-                b = b.split(",", 1)[1]
-            img_bytes = base64.b64decode(b)
+            img_source = decode_image_base64(image_base64)
         else:
             raise HTTPException(status_code=400, detail="No image provided")
 
-        pil_img = Image.open(BytesIO(img_bytes)).convert('RGB')
-
         # Resolve model path
-        resolved_model_path = model_path or os.getenv('DERMA_MODEL_PATH') or MODEL_PATH_DEFAULT
-        resolved_model_path = os.path.expanduser(resolved_model_path)
+        resolved_model_path = os.path.expanduser(model_path) if model_path else default_model_path()
 
-        model, _ = load_pytorch_model(resolved_model_path)
-        preds = predict_from_pil_image(model, pil_img, topk=topk)
+        preds, used_model_path = await infer_from_bytes(img_source, resolved_model_path, topk)
 
         return {
             "success": True,
             "predictions": preds,
-            "model_path": resolved_model_path
+            "model_path": used_model_path
         }
     except HTTPException:
         raise
@@ -651,32 +1192,12 @@ class GenerateReportRequest(BaseModel):
 async def generate_report(req: GenerateReportRequest):
     """Generate a professional report using LLM or fallback and return structured JSON plus a heatmap image."""
     try:
-        # produce heatmap using Grad-CAM if possible
-        image_data = req.image_base64
-        if "," in image_data:
-            b = image_data.split(",", 1)[1]
-        else:
-            b = image_data
-        img_bytes = base64.b64decode(b)
+        img_bytes = decode_image_base64(req.image_base64)
 
-        heatmap_b64 = None
-        try:
-            if torch is not None:
-                # attempt to load model and compute grad-cam
-                model_path = os.getenv('DERMA_MODEL_PATH') or MODEL_PATH_DEFAULT
-                model, _ = load_pytorch_model(model_path)
-                # preprocess image to tensor
-                pil = Image.open(BytesIO(img_bytes)).convert('RGB')
-                inp = image_preprocess_pil(pil)
-                cam = compute_gradcam(model, inp)
-                # cam may be HxW for single instance
-                if cam.ndim == 3:
-                    cam = cam[0]
-                heatmap_b64 = make_heatmap_overlay_from_cam(cam, img_bytes)
-        except Exception:
-            heatmap_b64 = generate_heatmap_overlay(img_bytes)
+        # produce heatmap using Grad-CAM if possible; model work runs off the event loop
+        heatmap_b64 = await run_in_threadpool(gradcam_heatmap_from_bytes, img_bytes, getattr(app.state, 'model', None))
 
-        report_json = generate_report_via_llm(req.analysis, req.symptoms, req.image_base64, req.language)
+        report_json = await run_in_threadpool(generate_report_via_llm, req.analysis, req.symptoms, req.image_base64, req.language)
         return {
             'success': True,
             'report': report_json,
@@ -686,6 +1207,61 @@ async def generate_report(req: GenerateReportRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+PDF_IMAGE_SIZE = 200
+PDF_CHUNK_SIZE = 64 * 1024
+PDF_DISCLAIMER = 'Disclaimer: This report is for educational purposes only and does not replace professional medical advice.'
+
+
+def pdf_paragraph_text(text: str) -> str:
+    """Escape text for a platypus Paragraph, keeping line breaks."""
+    return escape(str(text)).replace('\n', '<br/>')
+
+
+def pdf_image(image_b64: str):
+    """Build a platypus image from a base64 data URL, fitted into a PDF_IMAGE_SIZE square."""
+    data = base64.b64decode(image_b64.split(',')[-1])
+    iw, ih = ImageReader(BytesIO(data)).getSize()
+    scale = PDF_IMAGE_SIZE / max(iw, ih)
+    return RLImage(BytesIO(data), width=iw * scale, height=ih * scale)
+
+
+async def iter_buffer(buf: BytesIO, chunk_size: int = PDF_CHUNK_SIZE):
+    """Yield an in-memory buffer in fixed-size chunks (iterating BytesIO directly splits on newlines)."""
+    while chunk := buf.read(chunk_size):
+        yield chunk
+
+
+def build_report_pdf(report: dict, image_b64: Optional[str], heatmap_b64: Optional[str]) -> BytesIO:
+    """Lay out the report with platypus flowables and return the rendered PDF buffer (blocking)."""
+    styles = getSampleStyleSheet()
+    body = styles['BodyText']
+    heading = styles['Heading3']
+
+    buf = BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4, leftMargin=40, rightMargin=40, topMargin=40, bottomMargin=40)
+    story = [Paragraph(pdf_paragraph_text(report.get('title', 'DermaVision Report')), styles['Title'])]
+
+    # Original image and heatmap side by side
+    images = [pdf_image(b64) for b64 in (image_b64, heatmap_b64) if b64]
+    if images:
+        story.append(Table([images], hAlign='LEFT'))
+        story.append(Spacer(1, 12))
+
+    story.append(Paragraph(pdf_paragraph_text(report.get('summary', '')), body))
+    story.append(Paragraph('Findings:', heading))
+    story.append(Paragraph(pdf_paragraph_text(report.get('findings', '')), body))
+    story.append(Paragraph('Recommendations:', heading))
+    for rec in report.get('recommendations', []):
+        story.append(Paragraph(f'- {pdf_paragraph_text(rec)}', body))
+
+    story.append(Spacer(1, 20))
+    story.append(Paragraph(PDF_DISCLAIMER, styles['Italic']))
+
+    doc.build(story)
+    buf.seek(0)
+    return buf
+
+
 @app.post('/report/pdf')
 async def report_pdf(body: dict):
     """Accepts JSON body with `report` and `image_base64` and returns a PDF file stream."""
@@ -694,69 +1270,32 @@ async def report_pdf(body: dict):
         image_b64 = body.get('image_base64')
         heatmap_b64 = body.get('heatmap')
 
-        buf = BytesIO()
-        c = canvas.Canvas(buf, pagesize=A4)
-        width, height = A4
-        c.setFont('Helvetica-Bold', 18)
-        c.drawString(40, height-60, report.get('title', 'DermaVision Report'))
-
-        # Draw image (original)
-        if image_b64:
-            b = image_b64.split(',')[-1]
-            data = base64.b64decode(b)
-            img = ImageReader(BytesIO(data))
-            c.drawImage(img, 40, height-300, width=200, height=200, preserveAspectRatio=True)
-
-        # Draw heatmap if provided
-        if heatmap_b64:
-            b2 = heatmap_b64.split(',')[-1]
-            data2 = base64.b64decode(b2)
-            img2 = ImageReader(BytesIO(data2))
-            c.drawImage(img2, 260, height-300, width=200, height=200, preserveAspectRatio=True)
-
-        # Write summary and findings
-        text_y = height-320
-        c.setFont('Helvetica', 11)
-        summary = report.get('summary', '')
-        for line in summary.split('\n'):
-            c.drawString(40, text_y, line)
-            text_y -= 14
-
-        text_y -= 10
-        findings = report.get('findings', '')
-        c.setFont('Helvetica-Bold', 12)
-        c.drawString(40, text_y, 'Findings:')
-        text_y -= 16
-        c.setFont('Helvetica', 11)
-        for line in findings.split('\n'):
-            c.drawString(40, text_y, line)
-            text_y -= 14
-
-        text_y -= 10
-        c.setFont('Helvetica-Bold', 12)
-        c.drawString(40, text_y, 'Recommendations:')
-        text_y -= 16
-        c.setFont('Helvetica', 11)
-        for rec in report.get('recommendations', []):
-            c.drawString(40, text_y, f'- {rec}')
-            text_y -= 14
-
-        # Disclaimer
-        text_y -= 20
-        c.setFont('Helvetica', 9)
-        c.drawString(40, text_y, 'Disclaimer: This report is for educational purposes only and does not replace professional medical advice.')
-
-        c.showPage()
-        c.save()
-        buf.seek(0)
-
-        return StreamingResponse(buf, media_type='application/pdf', headers={
-            'Content-Disposition': 'attachment; filename="dermavision-report.pdf"'
+        buf = await run_in_threadpool(build_report_pdf, report, image_b64, heatmap_b64)
+
+        return StreamingResponse(iter_buffer(buf), media_type='application/pdf', headers={
+            'Content-Disposition': 'attachment; filename="dermavision-report.pdf"',
+            'Content-Length': str(buf.getbuffer().nbytes)
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 if __name__ == "__main__":
+    import importlib.util
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+
+    # Multiple workers need an import string (so each process re-imports the app); a single worker
+    # serves this module's app directly. Under `python -m` the module's real name is in __spec__.
+    if SERVER_WORKERS > 1:
+        app_module = __spec__.name if __spec__ else os.path.splitext(os.path.basename(__file__))[0]
+        target = f"{app_module}:app"
+    else:
+        target = app
+    uvicorn.run(
+        target,
+        host="0.0.0.0",
+        port=8000,
+        workers=SERVER_WORKERS,
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+    )